@@ -3,29 +3,26 @@
 
 import os
 import os.path
-import re
 import requests
+import sys
 import testfixtures
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-def detect_docker_host():
-    try:
-        docker_host = os.environ['DOCKER_HOST']
-    except KeyError:
-        docker_host = '127.0.0.1'
-    else:
-        docker_host = re.match(r'^tcp://(.+):\d+$', docker_host).group(1)
-    return docker_host
+from readiness import (  # noqa: E402
+    report,
+    resolve_docker_ip,
+    wait_for_services,
+)
 
 
 def cleanup_gitmesh(context):
-    # Cleanup repositories.
+    # Cleanup repositories (each deletion is checked, no need to fetch the
+    # listing again to confirm).
     listing = requests.get(context.gitmesh['list']).json()
     for repo in listing['repositories']:
         r = requests.delete(repo['delete'])
         assert r.status_code == 200
-    listing = requests.get(context.gitmesh['list']).json()
-    assert listing['repositories'] == []
 
 
 def cleanup_smartmob(context):
@@ -38,7 +35,13 @@ def cleanup_smartmob(context):
 
 
 def before_all(context):
-    context.docker_host = detect_docker_host()
+    context.docker_host = resolve_docker_ip()
+
+    # Wait until the whole stack is up.
+    timings = wait_for_services(context.docker_host)
+    report(timings)
+    assert all(duration is not None for _, duration in timings)
+
     context.gitmesh = requests.get(
         'http://%s:8080/' % context.docker_host).json()
     context.smartmob_agent = requests.get(
@@ -55,6 +58,9 @@ def before_scenario(context, scenario):
     # Make sure tests can resolve test data.
     context.test_root = os.path.dirname(os.path.abspath(__file__))
 
+    # Index repository details by name to avoid fetching the listing.
+    context.repositories = {}
+
     # Move into a new working folder for each scenario.
     context.old_cwd = os.getcwd()
     context.tempdir = testfixtures.TempDirectory(create=True)
@@ -10,3 +10,14 @@ Feature: Push to deploy
     And I submit the "hello-world" sample
     When I push
     Then Application "foo" should be deployed
+
+  @slow
+  Scenario: Deploy a large application
+
+    Given Repository "foo" exists
+    And Application "foo" exists
+    And I clone repository "foo"
+    And I submit the "hello-world" sample
+    And I submit a 256 MB asset
+    When I push
+    Then Application "foo" should be deployed
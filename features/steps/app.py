@@ -6,6 +6,7 @@ import os.path
 import requests
 import shutil
 import time
+import timeit
 
 from behave import given, then
 from subprocess import check_output, CalledProcessError, STDOUT
@@ -51,6 +52,27 @@ def submit_sample(context, name):
         print(output)
 
 
+@given('I submit a {size:d} MB asset')
+def submit_asset(context, size):
+    with open('asset.bin', 'wb') as stream:
+        for _ in range(size):
+            stream.write(os.urandom(1024 * 1024))
+    try:
+        output = check_output(['git', 'add', 'asset.bin'], stderr=STDOUT)
+    except CalledProcessError as e:
+        output = e.output
+        raise
+    finally:
+        print(output)
+    try:
+        output = check_output(['git', 'commit', '-m', 'Adds asset.'])
+    except CalledProcessError as e:
+        output = e.output
+        raise
+    finally:
+        print(output)
+
+
 @then('Application "{name}" should be deployed')
 def check_deployment(context, name):
     processes = requests.get(context.smartmob_agent['list']).json()
@@ -60,7 +82,20 @@ def check_deployment(context, name):
     p = processes[0]
     assert p['app'] == 'myapp'
     assert p['slug'] == 'myapp.1'
+
+    # Record how long the process spends in each state on its way to
+    # `processing` (states may be skipped or merged by the agent).
+    ref = since = timeit.default_timer()
+    state = p['state']
+    timings = []
     while p['state'] in ('pending', 'downloading', 'unpacking'):
         time.sleep(0.1)
         p = requests.get(p['details']).json()
+        if p['state'] != state:
+            now = timeit.default_timer()
+            timings.append((state, now - since))
+            state, since = p['state'], now
+    print('Time to "%s": %.3f s.' % (p['state'], since - ref))
+    for state, duration in timings:
+        print('  - "%s": %.3f s.' % (state, duration))
     assert p['state'] == 'processing'
@@ -1,12 +1,38 @@
 # -*- coding: utf-8 -*-
 
 
-import itertools
 import json
 import requests
 
 from behave import given, when, then
 from subprocess import check_output, CalledProcessError, STDOUT
+from urllib.parse import quote
+
+
+def find_repository(context, name):
+    """Lookup a repository's details by name.
+
+    Repositories created by the current scenario are indexed from the
+    creation response.  Other names are resolved with gitmesh's details
+    endpoint, falling back to the listing if it doesn't answer.
+    """
+    try:
+        return context.repositories[name]
+    except KeyError:
+        pass
+    url = '%s/%s' % (context.gitmesh['list'].rstrip('/'), quote(name, safe=''))
+    r = requests.get(url)
+    if r.status_code == 200:
+        repo = r.json()
+        # Make sure this is the details link gitmesh publishes for the repo.
+        assert repo['name'] == name
+        assert repo['details'] == url
+    else:
+        listing = requests.get(context.gitmesh['list']).json()
+        repos = {repo['name']: repo for repo in listing['repositories']}
+        repo = repos[name]
+    context.repositories[name] = repo
+    return repo
 
 
 @given('There are no repositories')
@@ -21,14 +47,12 @@ def provision_repository(context, name):
         'name': name,
     }))
     assert r.status_code == 201
+    context.repositories[name] = r.json()
 
 
 @given('I clone repository "{name}"')
 def clone(context, name):
-    listing = requests.get(context.gitmesh['list']).json()
-    clone_urls = list(itertools.chain(*(
-        repo['clone'] for repo in listing['repositories']
-    )))
+    clone_urls = find_repository(context, name)['clone']
     assert len(clone_urls) == 1
     try:
         output = check_output(
@@ -50,15 +74,14 @@ def create_repository(context, name):
         'name': name,
     }))
     assert r.status_code == 201
+    context.repositories[name] = r.json()
 
 
 @when('I delete repository "{name}"')
 def delete_repository(context, name):
-    listing = requests.get(context.gitmesh['list']).json()
-    repos = [repo for repo in listing['repositories'] if repo['name'] == name]
-    assert len(repos) == 1
-    r = requests.delete(repos[0]['delete'])
+    r = requests.delete(find_repository(context, name)['delete'])
     assert r.status_code == 200
+    del context.repositories[name]
 
 
 @when('I check the repository listing')
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+require 'fluent/clock'
+require 'fluent/plugin/filter'
+
+module Fluent::Plugin
+  # Rate limits Docker log lines with one token bucket per container.  Lines
+  # over the limit are sampled (1 in N is kept) and the others are dropped.
+  # Periodic summaries of sampled/dropped lines are emitted as events so
+  # that a noisy container is visible without flooding the logs.
+  class DockerThrottleFilter < Filter
+    Fluent::Plugin.register_filter('docker_throttle', self)
+
+    helpers :timer, :event_emitter
+
+    desc 'Record field that identifies the container.'
+    config_param :key, :string, default: 'container_name'
+    desc 'Lines per second each container may log.'
+    config_param :rate, :float, default: 100.0
+    desc 'Maximum burst (in lines) for each container.'
+    config_param :burst, :integer, default: 1000
+    desc 'Keep 1 in N lines over the limit (0 drops them all).'
+    config_param :sample, :integer, default: 100
+    desc 'Interval between summaries of throttled lines.'
+    config_param :summary_interval, :time, default: 60
+    desc 'Tag for summaries of throttled lines.'
+    config_param :summary_tag, :string, default: 'events.fluentd.throttle'
+
+    Bucket = Struct.new(:tokens, :updated, :overflow, :sampled, :dropped)
+
+    def start
+      super
+      @buckets = {}
+      @mutex = Mutex.new
+      timer_execute(:docker_throttle_summary, @summary_interval) do
+        emit_summaries
+      end
+    end
+
+    def filter(tag, time, record)
+      name = record[@key] || tag
+      now = Fluent::Clock.now
+      @mutex.synchronize do
+        bucket = @buckets[name] ||= Bucket.new(@burst.to_f, now, 0, 0, 0)
+        bucket.tokens = [
+          bucket.tokens + (now - bucket.updated) * @rate, @burst.to_f,
+        ].min
+        bucket.updated = now
+        if bucket.tokens >= 1.0
+          bucket.tokens -= 1.0
+          return record
+        end
+        bucket.overflow += 1
+        if @sample > 0 && (bucket.overflow - 1) % @sample == 0
+          bucket.sampled += 1
+          return record
+        end
+        bucket.dropped += 1
+        nil
+      end
+    end
+
+    def emit_summaries
+      summaries = @mutex.synchronize do
+        # Forget idle containers to keep memory bounded.
+        now = Fluent::Clock.now
+        @buckets.delete_if do |_, bucket|
+          bucket.overflow == 0 && bucket.tokens +
+            (now - bucket.updated) * @rate >= @burst
+        end
+        @buckets.select { |_, bucket| bucket.overflow > 0 }.map do |name, bucket|
+          summary = {
+            @key => name,
+            'sampled' => bucket.sampled,
+            'dropped' => bucket.dropped,
+          }
+          bucket.overflow = bucket.sampled = bucket.dropped = 0
+          summary
+        end
+      end
+      time = Fluent::EventTime.now
+      summaries.each do |summary|
+        router.emit(@summary_tag, time, summary)
+      end
+    end
+  end
+end
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+
+import argparse
+import asyncio
+import gzip
+import json
+import msgpack
+import re
+import struct
+import sys
+
+from aiohttp import web
+
+
+cli = argparse.ArgumentParser(description="Stream live logs over HTTP.")
+cli.add_argument('--host', action='store', dest='host',
+                 type=str, default='0.0.0.0')
+cli.add_argument('--port', action='store', dest='port',
+                 type=int, default=80)
+cli.add_argument('--forward-port', action='store', dest='forward_port',
+                 type=int, default=24224)
+cli.add_argument('--buffer-size', action='store', dest='buffer_size',
+                 type=int, default=1000,
+                 help="Records queued for each client before dropping it.")
+
+
+def compile_pattern(pattern):
+    """Convert a fluentd tag pattern (``a.*``, ``a.**``) to a regex."""
+    regex = re.escape(pattern)
+    if regex == r'\*\*':
+        regex = r'.*'
+    regex = regex.replace(r'\.\*\*', r'(?:\.[^.]+)*')
+    regex = regex.replace(r'\*\*\.', r'(?:[^.]+\.)*')
+    regex = regex.replace(r'\*', r'[^.]+')
+    return re.compile('^%s$' % regex)
+
+
+def event_time(value):
+    """Convert a forward protocol timestamp to seconds since the epoch."""
+    if isinstance(value, msgpack.ExtType) and value.code == 0:
+        seconds, nanoseconds = struct.unpack('>II', value.data)
+        return seconds + nanoseconds / 1e9
+    return value
+
+
+def unpack_entries(entries, options):
+    """Decode the ``[[time, record], ...]`` stream of a PackedForward."""
+    if isinstance(entries, str):
+        entries = entries.encode('utf-8', 'surrogateescape')
+    if options.get('compressed') == 'gzip':
+        entries = gzip.decompress(entries)
+    unpacker = msgpack.Unpacker(raw=False, unicode_errors='surrogateescape')
+    unpacker.feed(entries)
+    return list(unpacker)
+
+
+class Client(object):
+    """A subscriber with a bounded buffer of pending records."""
+
+    def __init__(self, patterns, buffer_size):
+        self.patterns = [compile_pattern(pattern) for pattern in patterns]
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+    def matches(self, tag):
+        return any(pattern.match(tag) for pattern in self.patterns)
+
+
+class Hub(object):
+    """Fans records out to all interested clients."""
+
+    def __init__(self):
+        self.clients = set()
+
+    def publish(self, tag, time, record):
+        for client in list(self.clients):
+            if not client.matches(tag):
+                continue
+            try:
+                client.queue.put_nowait((tag, time, record))
+            except asyncio.QueueFull:
+                # Slow consumer: drop it rather than buffer without bounds or
+                # hold up everybody else.
+                self.clients.discard(client)
+                client.dropped = True
+                client.queue.get_nowait()
+                client.queue.put_nowait(None)
+
+
+class ForwardProtocol(asyncio.Protocol):
+    """Server side of fluentd's forward protocol (Message, Forward and
+    PackedForward modes)."""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.unpacker = msgpack.Unpacker(
+            raw=False, unicode_errors='surrogateescape',
+        )
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.unpacker.feed(data)
+        for message in self.unpacker:
+            self.message_received(message)
+
+    def message_received(self, message):
+        tag, payload = message[0], message[1]
+        options = {}
+        if isinstance(payload, list):
+            # Forward mode.
+            entries = payload
+            if len(message) > 2:
+                options = message[2] or {}
+        elif isinstance(payload, (bytes, str)):
+            # PackedForward mode.
+            if len(message) > 2:
+                options = message[2] or {}
+            entries = unpack_entries(payload, options)
+        else:
+            # Message mode.
+            entries = [[payload, message[2]]]
+            if len(message) > 3:
+                options = message[3] or {}
+        for time, record in entries:
+            self.hub.publish(tag, event_time(time), record)
+        if 'chunk' in options:
+            self.transport.write(msgpack.packb({'ack': options['chunk']}))
+
+
+def render(item):
+    """Format a queued record (or the drop notice) as a server-sent event."""
+    if item is None:
+        return b'event: dropped\ndata: {}\n\n'
+    tag, time, record = item
+    return ('data: %s\n\n' % json.dumps({
+        'tag': tag,
+        'time': time,
+        'record': record,
+    })).encode('utf-8', 'surrogateescape')
+
+
+async def tail(request):
+    """Stream records for the requested tags as server-sent events."""
+
+    hub = request.app['livetail.hub']
+    patterns = request.GET.getall('tag', [])
+    if not patterns:
+        raise web.HTTPBadRequest
+
+    client = Client(patterns, request.app['livetail.buffer-size'])
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+    })
+    await response.prepare(request)
+    hub.clients.add(client)
+    try:
+        while True:
+            item = await client.queue.get()
+            response.write(render(item))
+            if item is None:
+                break
+            await response.drain()
+    finally:
+        hub.clients.discard(client)
+    return response
+
+
+async def start(loop, host, port, forward_port, buffer_size):
+    hub = Hub()
+    app = web.Application(loop=loop)
+    app['livetail.hub'] = hub
+    app['livetail.buffer-size'] = buffer_size
+    app.router.add_route('GET', '/tail', tail)
+    await loop.create_server(app.make_handler(), host, port)
+    await loop.create_server(lambda: ForwardProtocol(hub), host, forward_port)
+
+
+def main(arguments=None):
+    """Command-line entry point."""
+
+    if arguments is None:
+        arguments = sys.argv[1:]
+    arguments = cli.parse_args(arguments)
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(start(
+        loop, arguments.host, arguments.port,
+        arguments.forward_port, arguments.buffer_size,
+    ))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
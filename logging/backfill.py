@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+
+import argparse
+import bz2
+import datetime
+import gzip
+import json
+import lzma
+import os.path
+import queue
+import re
+import threading
+import timeit
+
+from provision import (
+    autoclose,
+    check_status,
+    parse_timestamp,
+    resolve_elasticsearch_url,
+)
+from urllib.error import HTTPError
+from urllib.parse import urljoin
+from urllib.request import urlopen, Request
+
+
+openers = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+
+def open_archive(path):
+    """Open a (possibly compressed) log file for reading, in binary mode."""
+    _, ext = os.path.splitext(path)
+    return openers.get(ext, open)(path, 'rb')
+
+
+def docker_document(record, container_id, container_name):
+    """Convert a Docker json-file record to the fluentd log driver's format.
+
+    json-file records look like ``{"log": "...\\n", "stream": "stdout",
+    "time": "..."}``.
+    """
+    return {
+        'container_id': container_id,
+        'container_name': container_name,
+        'source': record['stream'],
+        'log': record['log'].rstrip('\n'),
+    }, record['time']
+
+
+def events_document(record, *_):
+    """Events are archived in the format they were indexed in."""
+    document = dict(record)
+    timestamp = document.pop('@timestamp')
+    return document, timestamp
+
+
+def read_documents(path, kind, container_name=None):
+    """Yield ``(index, document)`` pairs, routed by their timestamp."""
+
+    # Docker names json-file logs after the container ID.
+    container_id = re.sub(r'-json\.log.*$', '', os.path.basename(path))
+    convert = docker_document if kind == 'docker' else events_document
+
+    with open_archive(path) as stream:
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line.decode('utf-8'))
+            document, timestamp = convert(
+                record, container_id, container_name or container_id,
+            )
+            timestamp = parse_timestamp(timestamp)
+            when = datetime.datetime.utcfromtimestamp(timestamp)
+            document['@timestamp'] = '%s.%03dZ' % (
+                when.strftime('%Y-%m-%dT%H:%M:%S'), when.microsecond // 1000,
+            )
+            yield '%s-%s' % (kind, when.strftime('%Y-%m-%d')), document
+
+
+def request(elasticsearch_url, path, body=None, method='GET'):
+    """Send a JSON request to ElasticSearch, return the decoded response."""
+    req = Request(
+        url=urljoin(elasticsearch_url, path),
+        data=body if body is None or isinstance(body, bytes)
+        else json.dumps(body).encode('utf-8'),
+        method=method,
+    )
+    with autoclose(urlopen(req)) as rep:
+        check_status(req, rep, {200, 201})
+        return json.loads(rep.read().decode('utf-8'))
+
+
+def relax_refresh_interval(elasticsearch_url, index):
+    """Disable refreshes on ``index``, return the setting to restore."""
+    try:
+        settings = request(elasticsearch_url, '%s/_settings' % index)
+    except HTTPError as error:
+        if error.code != 404:
+            raise
+        # Create the index (index templates still apply).
+        try:
+            request(elasticsearch_url, index, {
+                'settings': {'index': {'refresh_interval': '-1'}},
+            }, method='PUT')
+            return '1s'
+        except HTTPError as error:
+            # fluentd may have created it in the meantime (e.g. today's).
+            if error.code != 400 or b'IndexAlreadyExists' not in error.read():
+                raise
+        settings = request(elasticsearch_url, '%s/_settings' % index)
+    previous = settings[index]['settings']['index'].get(
+        'refresh_interval', '1s',
+    )
+    request(elasticsearch_url, '%s/_settings' % index, {
+        'index': {'refresh_interval': '-1'},
+    }, method='PUT')
+    return previous
+
+
+def restore_refresh_interval(elasticsearch_url, index, value):
+    request(elasticsearch_url, '%s/_settings' % index, {
+        'index': {'refresh_interval': value},
+    }, method='PUT')
+    request(elasticsearch_url, '%s/_refresh' % index, b'', method='POST')
+
+
+def bulk_body(batch):
+    lines = []
+    for index, document in batch:
+        lines.append(json.dumps({'index': {
+            '_index': index,
+            '_type': index.split('-', 1)[0],
+        }}))
+        lines.append(json.dumps(document))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def bulk_failures(response):
+    """Pick the items that failed from a ``_bulk`` response."""
+    return [
+        item['index'] for item in response['items']
+        if item['index'].get('error')
+    ]
+
+
+def backfill(elasticsearch_url, paths, kind, container_name=None,
+             workers=4, batch_size=1000, clock=timeit.default_timer):
+    """Stream archived logs into daily indices with parallel bulk requests.
+
+    Memory usage is bounded: at most ``2 * workers`` batches are queued.
+    """
+
+    batches = queue.Queue(maxsize=2 * workers)
+    errors = []
+    indexed = [0]
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            try:
+                failed = bulk_failures(request(
+                    elasticsearch_url, '_bulk', bulk_body(batch),
+                    method='POST',
+                ))
+            except Exception as error:
+                failed = [str(error)] * len(batch)
+            with lock:
+                indexed[0] += len(batch) - len(failed)
+                errors.extend(failed)
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    refresh_intervals = {}
+    ref = clock()
+    try:
+        batch = []
+        for path in paths:
+            for index, document in read_documents(path, kind,
+                                                  container_name):
+                if index not in refresh_intervals:
+                    refresh_intervals[index] = relax_refresh_interval(
+                        elasticsearch_url, index,
+                    )
+                batch.append((index, document))
+                if len(batch) == batch_size:
+                    batches.put(batch)
+                    batch = []
+        if batch:
+            batches.put(batch)
+    finally:
+        for _ in threads:
+            batches.put(None)
+        for thread in threads:
+            thread.join()
+        duration = clock() - ref
+        # Restore all indices, even if some fail, so that as few as possible
+        # are left with refreshes disabled.
+        failures = []
+        for index, value in sorted(refresh_intervals.items()):
+            try:
+                restore_refresh_interval(elasticsearch_url, index, value)
+            except Exception as error:
+                print('Could not restore refresh_interval=%s on "%s": %s' % (
+                    value, index, error,
+                ))
+                failures.append(error)
+        if failures:
+            raise failures[0]
+
+    print('Indexed %d documents in %d indices in %.3f s (%.0f docs/s).' % (
+        indexed[0], len(refresh_intervals), duration,
+        indexed[0] / duration if duration else 0.0,
+    ))
+    if errors:
+        print('%d documents failed, first error: %r' % (
+            len(errors), errors[0],
+        ))
+    return indexed[0], errors
+
+
+cli = argparse.ArgumentParser(
+    description="Load archived logs into daily ElasticSearch indices.",
+)
+cli.add_argument('--kind', action='store', dest='kind',
+                 choices={'docker', 'events'}, default='docker',
+                 help="Docker json-file logs, or NDJSON events.")
+cli.add_argument('--container-name', action='store', dest='container_name',
+                 type=str, default=None,
+                 help="Container name for Docker logs (default: its ID).")
+cli.add_argument('--workers', action='store', dest='workers',
+                 type=int, default=4)
+cli.add_argument('--batch-size', action='store', dest='batch_size',
+                 type=int, default=1000)
+cli.add_argument('paths', nargs='+', metavar='path',
+                 help="Log files (.gz, .bz2 and .xz are decompressed).")
+
+
+if __name__ == '__main__':
+    arguments = cli.parse_args()
+    backfill(
+        resolve_elasticsearch_url(),
+        arguments.paths,
+        arguments.kind,
+        container_name=arguments.container_name,
+        workers=arguments.workers,
+        batch_size=arguments.batch_size,
+    )
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import division, print_function
+
+import argparse
+import json
+
+from provision import (
+    autoclose,
+    check_status,
+    parse_timestamp,
+    resolve_elasticsearch_url,
+)
+
+try:
+    from urllib.request import urlopen, Request
+    from urllib.parse import urljoin
+except ImportError:
+    # Python 2.7.
+    from urllib2 import urlopen, Request
+    from urlparse import urljoin
+
+
+# Upper bounds (in seconds) of the histogram buckets.
+BUCKETS = [0.01, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, float('inf')]
+
+
+def search(elasticsearch_url, since):
+    """Fetch all events that carry a correlation ID (scan & scroll)."""
+    req = Request(
+        url=urljoin(elasticsearch_url,
+                    'events-*/events/_search?search_type=scan&scroll=1m'),
+        data=json.dumps({
+            'size': 500,
+            'query': {
+                'filtered': {
+                    'filter': {
+                        'and': [
+                            {'exists': {'field': 'correlation_id'}},
+                            {'range': {'@timestamp': {'gte': since}}},
+                        ],
+                    },
+                },
+            },
+        }).encode('utf-8'),
+    )
+    with autoclose(urlopen(req)) as rep:
+        check_status(req, rep, {200})
+        body = json.loads(rep.read().decode('utf-8'))
+    while True:
+        req = Request(
+            url=urljoin(elasticsearch_url, '_search/scroll?scroll=1m'),
+            data=body['_scroll_id'].encode('utf-8'),
+        )
+        with autoclose(urlopen(req)) as rep:
+            check_status(req, rep, {200})
+            body = json.loads(rep.read().decode('utf-8'))
+        hits = body['hits']['hits']
+        if not hits:
+            break
+        for hit in hits:
+            yield hit['_source']
+
+
+def collect_traces(events):
+    """Group events by correlation ID, in chronological order."""
+    traces = {}
+    for event in events:
+        event['@timestamp'] = parse_timestamp(event['@timestamp'])
+        traces.setdefault(event['correlation_id'], []).append(event)
+    for trace in traces.values():
+        trace.sort(key=lambda event: event['@timestamp'])
+    return traces
+
+
+def stage_durations(trace):
+    """Compute ``(stage, duration)`` pairs for one deploy.
+
+    Events that record their own ``duration`` are trusted; otherwise the
+    stage lasts from the previous event in the trace.
+    """
+    stages = []
+    for previous, event in zip([None] + trace[:-1], trace):
+        stage = '%s.%s' % (event.get('service'), event.get('event'))
+        duration = event.get('duration')
+        if duration is None:
+            if previous is None:
+                continue
+            duration = event['@timestamp'] - previous['@timestamp']
+        stages.append((stage, float(duration)))
+    return stages
+
+
+def histogram(durations):
+    """Count durations in each of the ``BUCKETS``."""
+    counts = [0] * len(BUCKETS)
+    for duration in durations:
+        for i, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                counts[i] += 1
+                break
+    return counts
+
+
+def percentile(durations, p):
+    durations = sorted(durations)
+    return durations[min(int(len(durations) * p), len(durations) - 1)]
+
+
+def report(traces, slow):
+    """Print per-stage latency histograms and flag slow deploys."""
+
+    stages = {}
+    for trace in traces.values():
+        for stage, duration in stage_durations(trace):
+            stages.setdefault(stage, []).append(duration)
+
+    print('Deploys: %d' % len(traces))
+    for stage in sorted(stages):
+        durations = stages[stage]
+        print()
+        print('%s (n=%d, p50=%.3f s, p95=%.3f s, max=%.3f s)' % (
+            stage, len(durations),
+            percentile(durations, 0.50),
+            percentile(durations, 0.95),
+            max(durations),
+        ))
+        counts = histogram(durations)
+        width = max(counts)
+        for bound, count in zip(BUCKETS, counts):
+            print(('  <= %6s s %6d %s' % (
+                '%g' % bound, count, '#' * int(round(40 * count / width)),
+            )).rstrip())
+
+    print()
+    print('Slow deploys (> %g s):' % slow)
+    for correlation_id, trace in sorted(traces.items()):
+        total = trace[-1]['@timestamp'] - trace[0]['@timestamp']
+        if total > slow:
+            print('  %s: %.3f s' % (correlation_id, total))
+
+
+cli = argparse.ArgumentParser(description="Analyze deploy latency.")
+cli.add_argument('--since', action='store', dest='since',
+                 type=str, default='now-1d',
+                 help="Only consider events after this (ElasticSearch date "
+                      "math, e.g. now-1h).")
+cli.add_argument('--slow', action='store', dest='slow',
+                 type=float, default=60.0,
+                 help="Flag deploys that take longer (in seconds).")
+
+
+if __name__ == '__main__':
+    arguments = cli.parse_args()
+    elasticsearch_url = resolve_elasticsearch_url()
+    report(
+        collect_traces(search(elasticsearch_url, arguments.since)),
+        arguments.slow,
+    )
@@ -3,16 +3,16 @@
 
 from __future__ import print_function
 
+import calendar
+import datetime
 import errno
 import os
 import os.path
 import re
 import socket
-import time
-import timeit
+import sys
 
 try:
-    from urllib.error import URLError
     from urllib.request import urlopen, Request
     from urllib.parse import urljoin
     def autoclose(x):
@@ -20,7 +20,7 @@ try:
 except ImportError:
     # Python 2.7.
     from contextlib import contextmanager
-    from urllib2 import URLError, urlopen, Request
+    from urllib2 import urlopen, Request
     from urlparse import urljoin
     @contextmanager
     def autoclose(x):
@@ -28,12 +28,15 @@ except ImportError:
             yield x
         finally:
             x.close()
-    class ConnectionResetError(Exception):
-        pass
 
 
 here = os.path.dirname(os.path.abspath(__file__))
 
+# Share Docker host detection with the readiness checks.
+sys.path.insert(0, os.path.join(here, '..'))
+
+from readiness import resolve_docker_ip  # noqa: E402
+
 
 def readfile(path):
     """Read a binary file's contents into a byte string."""
@@ -43,13 +46,7 @@ def readfile(path):
 
 def resolve_elasticsearch_url(elasticsearch_port=9200):
     """Deduce ElasticSearch URL from ``DOCKER_HOST``."""
-    docker_host = os.environ.get('DOCKER_HOST', '')
-    if docker_host:
-        match = re.match(r'^tcp://(.+?):\d+$', docker_host)
-        docker_ip = match.group(1)
-    else:
-        docker_ip = '127.0.0.1'
-    return 'http://%s:%d' % (docker_ip, elasticsearch_port)
+    return 'http://%s:%d' % (resolve_docker_ip(), elasticsearch_port)
 
 
 def check_status(req, rep, status_codes={200, 201}):
@@ -68,28 +65,31 @@ def check_status(req, rep, status_codes={200, 201}):
         )
 
 
-def provision(elasticsearch_url, clock=timeit.default_timer, timeout=30.0):
-    """Upload logging configurations to ElasticSearch."""
+def parse_timestamp(value):
+    """Convert an ISO 8601 timestamp to seconds since the epoch."""
+    match = re.match(
+        r'^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(\.\d+)?'
+        r'(Z|([+-])(\d{2}):?(\d{2}))?$', value,
+    )
+    if not match:
+        raise ValueError('Invalid timestamp "%s".' % value)
+    when = datetime.datetime.strptime(match.group(1), '%Y-%m-%dT%H:%M:%S')
+    seconds = calendar.timegm(when.timetuple())
+    if match.group(2):
+        seconds += float(match.group(2))
+    if match.group(4):
+        offset = int(match.group(5)) * 3600 + int(match.group(6)) * 60
+        seconds -= offset if match.group(4) == '+' else -offset
+    return seconds
 
-    print('URL:', elasticsearch_url)
 
-    # Wait until ElasticSearch is responsive.
-    #
-    # NOTE: this is just a convenience to tolerate for the ElasticSearch Docker
-    #       container to start up.  After the timeout is elapsed, proceed as
-    #       usual to get "real" diagnostics as if we didn't poll at all.
-    ref = clock()
-    while (clock() - ref) < timeout:
-        try:
-            req = Request(url=elasticsearch_url)
-            with autoclose(urlopen(req)) as rep:
-                check_status(req, rep, {200})
-                break
-        except (ConnectionResetError, URLError) as error:
-            # Even though URLError is a subclass of OSError and has an
-            # ``errno`` attribute, it seems like it's set to ``None``, so we
-            # cannot portably test for ``errno.ECONNREFUSED``...
-            time.sleep(1.0)
+def provision(elasticsearch_url):
+    """Upload logging configurations to ElasticSearch.
+
+    ElasticSearch should accept requests already (see `readiness.py`).
+    """
+
+    print('URL:', elasticsearch_url)
 
     # Upload ElasticSearch index templates (1 of 2).
     req = Request(
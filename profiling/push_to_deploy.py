@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+
+import argparse
+import os
+import os.path
+import re
+import subprocess
+import sys
+
+from collections import Counter
+
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# Containers to profile.  gitmesh-deploy runs inside the gitmesh container
+# (from the Git hooks), so it's covered by following subprocesses.
+SERVICES = [
+    'gitmesh',
+    'smartmob-agent',
+    'fileserver',
+]
+
+# Where py-spy writes its output inside each container.
+PROFILE_PATH = '/tmp/py-spy.txt'
+
+# Installed in the containers on demand, so regular images don't ship it.
+PY_SPY_VERSION = '0.3.14'
+
+# The override grants the ``SYS_PTRACE`` capability py-spy needs.
+COMPOSE = [
+    'docker-compose',
+    '-f', os.path.join(here, '..', 'docker-compose.yml'),
+    '-f', os.path.join(here, '..', 'docker-compose.profiling.yml'),
+]
+
+
+def start_services():
+    """(Re)create the profiled containers with the profiling override."""
+    subprocess.check_call(COMPOSE + ['up', '-d'] + SERVICES)
+
+
+def container_id(service):
+    """Resolve a Docker Compose service name to its container ID."""
+    output = subprocess.check_output(COMPOSE + ['ps', '-q', service])
+    return output.decode('utf-8').strip()
+
+
+def install_profiler(container):
+    """Install (a pinned version of) py-spy in the container."""
+    subprocess.check_call([
+        'docker', 'exec', container,
+        'pip', 'install', '-q', 'py-spy==%s' % PY_SPY_VERSION,
+    ])
+
+
+def start_profiler(container, rate):
+    """Attach py-spy to all processes in the container."""
+    return subprocess.Popen([
+        'docker', 'exec', container,
+        'py-spy', 'record',
+        '--pid', '1',
+        '--subprocesses',
+        '--nonblocking',
+        '--rate', str(rate),
+        '--format', 'raw',
+        '--output', PROFILE_PATH,
+    ])
+
+
+def stop_profiler(container, profiler, path):
+    """Interrupt py-spy (it writes its output on SIGINT) and collect it."""
+    # py-spy may have exited already (e.g. it failed to attach): don't
+    # insist, the copy below fails if there's no output.
+    subprocess.call([
+        'docker', 'exec', container, 'pkill', '-INT', 'py-spy',
+    ])
+    profiler.wait()
+    subprocess.check_call([
+        'docker', 'cp', '%s:%s' % (container, PROFILE_PATH), path,
+    ])
+
+
+def load_stacks(path):
+    """Parse collapsed stacks (``frame;frame;frame count`` lines)."""
+    with open(path, 'r') as stream:
+        for line in stream:
+            match = re.match(r'^(.*) (\d+)$', line.strip())
+            if match:
+                yield match.group(1).split(';'), int(match.group(2))
+
+
+def hot_functions(profiles):
+    """Count samples per function, across all services.
+
+    :return: A pair of counters, for self time (the function was on top of
+       the stack) and total time (the function was anywhere on the stack).
+    """
+    own = Counter()
+    total = Counter()
+    for service, path in profiles:
+        for frames, count in load_stacks(path):
+            # Frames are prefixed with the process name and PID when
+            # following subprocesses; keep only function frames.
+            frames = [
+                '%s: %s' % (service, frame) for frame in frames
+                if not frame.startswith('process ')
+            ]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+    return own, total
+
+
+def report(profiles, top):
+    """Print the top-N hot functions, merged across services."""
+    own, total = hot_functions(profiles)
+    samples = sum(own.values()) or 1
+    print('%8s %8s  %s' % ('self', 'total', 'function'))
+    for frame, count in own.most_common(top):
+        print('%7.1f%% %7.1f%%  %s' % (
+            100.0 * count / samples,
+            100.0 * total[frame] / samples,
+            frame,
+        ))
+
+
+cli = argparse.ArgumentParser(
+    description="Profile the push-to-deploy flow.",
+)
+cli.add_argument('--output', action='store', dest='output',
+                 type=str, default='profiles',
+                 help="Folder for per-service profiles (collapsed stacks, "
+                      "open them with speedscope or flamegraph.pl).")
+cli.add_argument('--rate', action='store', dest='rate',
+                 type=int, default=100,
+                 help="Samples per second.")
+cli.add_argument('--top', action='store', dest='top',
+                 type=int, default=30,
+                 help="Number of hot functions to report.")
+
+
+def main(arguments=None):
+    """Command-line entry point."""
+
+    if arguments is None:
+        arguments = sys.argv[1:]
+    arguments = cli.parse_args(arguments)
+    if not os.path.isdir(arguments.output):
+        os.makedirs(arguments.output)
+
+    start_services()
+    containers = [(service, container_id(service)) for service in SERVICES]
+    for _, container in containers:
+        install_profiler(container)
+    profilers = [
+        start_profiler(container, arguments.rate)
+        for _, container in containers
+    ]
+    try:
+        status = subprocess.call([
+            'behave', os.path.join(here, '..', 'features',
+                                   'push-to-deploy.feature'),
+        ])
+    finally:
+        profiles = []
+        for (service, container), profiler in zip(containers, profilers):
+            path = os.path.join(arguments.output, '%s.txt' % service)
+            # Stop all profilers, even if some fail.
+            try:
+                stop_profiler(container, profiler, path)
+            except (OSError, subprocess.CalledProcessError) as error:
+                print('No profile for %s: %s' % (service, error))
+                continue
+            profiles.append((service, path))
+
+    report(profiles, arguments.top)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function
+
+import os
+import re
+import socket
+import sys
+import threading
+import time
+import timeit
+
+try:
+    from http.client import HTTPException
+    from urllib.error import HTTPError, URLError
+    from urllib.request import urlopen
+except ImportError:
+    # Python 2.7.
+    from httplib import HTTPException
+    from urllib2 import HTTPError, URLError, urlopen
+
+    class ConnectionError(Exception):
+        pass
+
+
+# Services started by `docker-compose.yml`, with the probe used to check that
+# each one accepts requests on its published port.
+SERVICES = [
+    ('elasticsearch', 'http', 9200),
+    ('fluentd', 'tcp', 24224),
+    ('livetail', 'http', 8083),
+    ('fileserver', 'http', 8082),
+    ('gitmesh', 'http', 8080),
+    ('smartmob-agent', 'http', 8081),
+]
+
+
+def resolve_docker_ip():
+    """Deduce Docker host IP from ``DOCKER_HOST``."""
+    docker_host = os.environ.get('DOCKER_HOST', '')
+    if docker_host:
+        match = re.match(r'^tcp://(.+?):\d+$', docker_host)
+        return match.group(1)
+    return '127.0.0.1'
+
+
+def probe_http(host, port, timeout):
+    """Check that an HTTP server answers (any status code will do)."""
+    try:
+        urlopen('http://%s:%d/' % (host, port), timeout=timeout).close()
+    except HTTPError:
+        # The server is up, it just doesn't like our request.
+        pass
+
+
+def probe_tcp(host, port, timeout):
+    """Check that a TCP server accepts connections."""
+    socket.create_connection((host, port), timeout=timeout).close()
+
+
+probes = {
+    'http': probe_http,
+    'tcp': probe_tcp,
+}
+
+
+def wait_until_ready(probe, host, port, deadline,
+                     clock=timeit.default_timer, interval=0.1):
+    """Poll a service until it responds or the deadline expires.
+
+    :return: The time it took for the service to respond, in seconds, or
+       ``None`` if the deadline expired first.
+    """
+    ref = clock()
+    while True:
+        remaining = deadline - clock()
+        if remaining <= 0.0:
+            return None
+        try:
+            probe(host, port, timeout=min(remaining, 2.0))
+            return clock() - ref
+        except (ConnectionError, HTTPException, URLError,
+                socket.error, socket.timeout):
+            # Services that are still starting may accept connections and
+            # then close them early or send garbage: keep polling.
+            time.sleep(min(interval, max(deadline - clock(), 0.0)))
+
+
+def wait_for_services(docker_ip, services=SERVICES,
+                      clock=timeit.default_timer, timeout=60.0):
+    """Probe all services concurrently under a shared deadline.
+
+    :return: A list of ``(name, duration)`` pairs, in the same order as
+       ``services``, where ``duration`` is the service's time-to-ready (in
+       seconds) or ``None`` if it didn't respond before the deadline.
+    """
+    deadline = clock() + timeout
+    timings = [None] * len(services)
+
+    def wait(index, probe, port):
+        timings[index] = wait_until_ready(
+            probes[probe], docker_ip, port, deadline, clock=clock,
+        )
+
+    threads = [
+        threading.Thread(target=wait, args=(index, probe, port))
+        for index, (_, probe, port) in enumerate(services)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [(name, timings[i]) for i, (name, _, _) in enumerate(services)]
+
+
+def report(timings):
+    """Print each service's time-to-ready."""
+    for name, duration in timings:
+        if duration is None:
+            print('%-16s not ready' % name)
+        else:
+            print('%-16s %.3f s' % (name, duration))
+
+
+if __name__ == '__main__':
+    timings = wait_for_services(resolve_docker_ip())
+    report(timings)
+    if any(duration is None for _, duration in timings):
+        sys.exit(1)
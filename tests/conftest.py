@@ -2,7 +2,30 @@
 
 
 import aiohttp
+import os.path
 import pytest
+import sys
+
+# Scripts in `logging/`, `livetail/` and `profiling/` are not part of a
+# package (and the name `logging` would shadow the standard library's), so
+# put the folders themselves on the path.
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..', 'logging'))
+sys.path.insert(0, os.path.join(here, '..', 'livetail'))
+sys.path.insert(0, os.path.join(here, '..', 'profiling'))
+
+from fluentd_standin import FluentdStandin  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmark', action='store_true', default=False,
+                     help="Run (slow) benchmarks.")
+
+
+@pytest.fixture(scope='session')
+def benchmark(request):
+    if not request.config.getoption('--benchmark'):
+        pytest.skip("Benchmarks are disabled (use `--benchmark`).")
 
 
 @pytest.fixture(scope='session')
@@ -14,7 +37,24 @@ def elasticsearch(docker_ip, docker_services):
     return url
 
 
+@pytest.fixture(scope='session')
+def fileserver(docker_ip, docker_services):
+    url = 'http://%s:%d' % (
+        docker_ip,
+        docker_services.port_for('fileserver', 80)
+    )
+    return url
+
+
 @pytest.fixture(scope='function')
 def http_client(event_loop):
     with aiohttp.ClientSession() as session:
         yield session
+
+
+@pytest.fixture(scope='function')
+def fluentd(event_loop):
+    fluentd = FluentdStandin(event_loop)
+    event_loop.run_until_complete(fluentd.start())
+    yield fluentd
+    event_loop.run_until_complete(fluentd.stop())
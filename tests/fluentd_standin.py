@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""In-process stand-in for the fluentd container.
+
+Accepts records over the forward protocol and over HTTP (like `in_forward`
+and `in_http`) and routes them the way `fluentd/fluent.conf` does:
+
+- `docker.**` records are indexed in `docker-YYYY-MM-DD` with `_type=docker`;
+- `events.**` records get `service` and `event` fields derived from the tag
+  (like the `record_transformer` filter) and are indexed in
+  `events-YYYY-MM-DD` with `_type=events`.
+
+Records end up in an ElasticSearch stand-in (a dict of lists) where tests
+can inspect them right away.  The throttling and multi-line coalescing
+stages of the docker pipeline are not reproduced.
+
+The forward protocol is decoded by `livetail/livetail.py`'s implementation,
+so both servers accept the same modes and encodings.
+"""
+
+
+import datetime
+import json
+import time
+
+from aiohttp import web
+from livetail import ForwardProtocol, compile_pattern
+from urllib.parse import parse_qs
+
+
+def logstash_index(prefix, timestamp):
+    """Daily index name (``logstash_format true``)."""
+    when = datetime.datetime.utcfromtimestamp(timestamp)
+    return '%s-%s' % (prefix, when.strftime('%Y-%m-%d'))
+
+
+def logstash_timestamp(timestamp):
+    when = datetime.datetime.utcfromtimestamp(timestamp)
+    return when.strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+
+def transform_event(tag, record):
+    """Reproduce the `record_transformer` filter on `events.**`."""
+    parts = tag.split('.')
+    record = dict(record)
+    record['event'] = '.'.join(parts[2:]) or None  # ${tag_suffix[2]}
+    record['service'] = parts[1] if len(parts) > 1 else None
+    return record
+
+
+class ElasticSearchStandin(object):
+    """Collects documents by index, like the `elasticsearch` output."""
+
+    def __init__(self):
+        self.indices = {}
+
+    def index(self, prefix, type_name, timestamp, record):
+        document = dict(record)
+        document['@timestamp'] = logstash_timestamp(timestamp)
+        self.indices.setdefault(
+            logstash_index(prefix, timestamp), [],
+        ).append({
+            '_type': type_name,
+            '_source': document,
+        })
+
+    def search(self, index):
+        return [hit['_source'] for hit in self.indices.get(index, [])]
+
+
+class Router(object):
+    """Routes records to outputs like `fluent.conf`."""
+
+    def __init__(self, elasticsearch):
+        self.elasticsearch = elasticsearch
+        self.unmatched = []
+        self.rules = [
+            (compile_pattern('docker.**'), self.docker),
+            (compile_pattern('events.**'), self.events),
+        ]
+
+    def publish(self, tag, timestamp, record):
+        for pattern, output in self.rules:
+            if pattern.match(tag):
+                output(tag, timestamp, record)
+                return
+        self.unmatched.append((tag, timestamp, record))
+
+    def docker(self, tag, timestamp, record):
+        self.elasticsearch.index('docker', 'docker', timestamp, record)
+
+    def events(self, tag, timestamp, record):
+        self.elasticsearch.index(
+            'events', 'events', timestamp, transform_event(tag, record),
+        )
+
+
+async def http_source(request):
+    """Accept records like `in_http` (form-encoded or JSON body)."""
+
+    router = request.app['fluentd.router']
+    tag = request.match_info['tag']
+    body = await request.text()
+    if request.content_type == 'application/json':
+        record = json.loads(body)
+    else:
+        record = json.loads(parse_qs(body)['json'][0])
+    timestamp = parse_qs(request.query_string).get('time')
+    timestamp = float(timestamp[0]) if timestamp else time.time()
+    router.publish(tag, timestamp, record)
+    return web.Response(body=b'')
+
+
+class FluentdStandin(object):
+    """Forward protocol & HTTP sources on ephemeral ports."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.elasticsearch = ElasticSearchStandin()
+        self.router = Router(self.elasticsearch)
+        self.servers = []
+
+    async def start(self, host='127.0.0.1'):
+        server = await self.loop.create_server(
+            lambda: ForwardProtocol(self.router), host, 0,
+        )
+        self.servers.append(server)
+        self.forward_port = server.sockets[0].getsockname()[1]
+
+        app = web.Application(loop=self.loop)
+        app['fluentd.router'] = self.router
+        app.router.add_route('POST', '/{tag}', http_source)
+        self.handler = app.make_handler()
+        server = await self.loop.create_server(self.handler, host, 0)
+        self.servers.append(server)
+        self.http_url = 'http://%s:%d' % (
+            host, server.sockets[0].getsockname()[1],
+        )
+
+    async def stop(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
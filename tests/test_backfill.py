@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+
+import gzip
+import io
+import json
+import os.path
+import pytest
+import threading
+
+from backfill import (
+    backfill,
+    bulk_body,
+    bulk_failures,
+    docker_document,
+    read_documents,
+    relax_refresh_interval,
+    request,
+    restore_refresh_interval,
+)
+from urllib.error import HTTPError
+
+
+CONTAINER_ID = '0123456789abcdef'
+
+
+def write_archive(folder, name, records):
+    """Write NDJSON records (and a blank line) to a gzipped log file."""
+    path = os.path.join(str(folder), name)
+    with gzip.open(path, 'wb') as stream:
+        for record in records:
+            stream.write(json.dumps(record).encode('utf-8') + b'\n')
+        stream.write(b'\n')
+    return path
+
+
+def json_file_record(log, time, stream='stdout'):
+    return {'log': log + '\n', 'stream': stream, 'time': time}
+
+
+class FakeElasticSearch(object):
+    """Records requests, answers like ElasticSearch would."""
+
+    def __init__(self, settings=None, failures=0):
+        self.settings = settings or {}
+        self.failures = failures
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def __call__(self, elasticsearch_url, path, body=None, method='GET'):
+        self.requests.append((method, path, body))
+        index = path.split('/', 1)[0]
+        if method == 'GET':
+            if index not in self.settings:
+                raise HTTPError(path, 404, 'Not Found', {}, None)
+            return {index: {'settings': {'index': self.settings[index]}}}
+        if path == '_bulk':
+            lines = body.decode('utf-8').splitlines()
+            items = [{'index': {'status': 201}} for _ in lines[::2]]
+            with self.lock:
+                for item in items[:self.failures]:
+                    item['index']['error'] = 'MapperParsingException'
+                self.failures -= min(self.failures, len(items))
+            return {'items': items}
+        return {'acknowledged': True}
+
+
+def test_docker_document():
+    document, timestamp = docker_document(
+        json_file_record('Hello, world!', '2016-10-19T12:00:00.5Z', 'stderr'),
+        CONTAINER_ID, 'a-container-name',
+    )
+    assert document == {
+        'container_id': CONTAINER_ID,
+        'container_name': 'a-container-name',
+        'source': 'stderr',
+        'log': 'Hello, world!',
+    }
+    assert timestamp == '2016-10-19T12:00:00.5Z'
+
+
+def test_read_documents_docker(tmpdir):
+    path = write_archive(tmpdir, '%s-json.log.1.gz' % CONTAINER_ID, [
+        json_file_record('a', '2016-10-19T23:59:59.5Z'),
+        # Routed by UTC date, not by local date.
+        json_file_record('b', '2016-10-20T01:00:00+02:00'),
+        json_file_record('c', '2016-10-20T00:00:00Z'),
+    ])
+    documents = list(read_documents(path, 'docker'))
+    assert [(index, document['log'], document['@timestamp'])
+            for index, document in documents] == [
+        ('docker-2016-10-19', 'a', '2016-10-19T23:59:59.500Z'),
+        ('docker-2016-10-19', 'b', '2016-10-19T23:00:00.000Z'),
+        ('docker-2016-10-20', 'c', '2016-10-20T00:00:00.000Z'),
+    ]
+    # The container ID comes from the file name.
+    assert {document['container_id'] for _, document in documents} == {
+        CONTAINER_ID,
+    }
+    assert {document['container_name'] for _, document in documents} == {
+        CONTAINER_ID,
+    }
+
+
+def test_read_documents_events(tmpdir):
+    path = write_archive(tmpdir, 'events.ndjson.gz', [{
+        '@timestamp': '2016-10-19T12:00:00+00:00',
+        'service': 'gitmesh',
+        'event': 'push',
+    }])
+    assert list(read_documents(path, 'events')) == [
+        ('events-2016-10-19', {
+            '@timestamp': '2016-10-19T12:00:00.000Z',
+            'service': 'gitmesh',
+            'event': 'push',
+        }),
+    ]
+
+
+def test_bulk_body():
+    body = bulk_body([
+        ('docker-2016-10-19', {'log': 'a'}),
+        ('events-2016-10-20', {'event': 'push'}),
+    ])
+    assert body.endswith(b'\n')
+    assert [json.loads(line) for line in body.decode('utf-8').split('\n')
+            if line] == [
+        {'index': {'_index': 'docker-2016-10-19', '_type': 'docker'}},
+        {'log': 'a'},
+        {'index': {'_index': 'events-2016-10-20', '_type': 'events'}},
+        {'event': 'push'},
+    ]
+
+
+def test_bulk_failures():
+    assert bulk_failures({'items': [
+        {'index': {'status': 201}},
+        {'index': {'status': 400, 'error': 'MapperParsingException'}},
+    ]}) == [{'status': 400, 'error': 'MapperParsingException'}]
+
+
+def test_relax_refresh_interval_existing(monkeypatch):
+    elasticsearch = FakeElasticSearch(settings={
+        'docker-2016-10-19': {'refresh_interval': '5s'},
+    })
+    monkeypatch.setattr('backfill.request', elasticsearch)
+    previous = relax_refresh_interval('http://es', 'docker-2016-10-19')
+    assert previous == '5s'
+    assert elasticsearch.requests[-1] == (
+        'PUT', 'docker-2016-10-19/_settings',
+        {'index': {'refresh_interval': '-1'}},
+    )
+
+
+def test_relax_refresh_interval_default(monkeypatch):
+    elasticsearch = FakeElasticSearch(settings={'docker-2016-10-19': {}})
+    monkeypatch.setattr('backfill.request', elasticsearch)
+    assert relax_refresh_interval('http://es', 'docker-2016-10-19') == '1s'
+
+
+def test_relax_refresh_interval_missing_index(monkeypatch):
+    elasticsearch = FakeElasticSearch()
+    monkeypatch.setattr('backfill.request', elasticsearch)
+    previous = relax_refresh_interval('http://es', 'docker-2016-10-19')
+    assert previous == '1s'
+    # The index is created with refreshes disabled.
+    assert elasticsearch.requests[-1] == (
+        'PUT', 'docker-2016-10-19',
+        {'settings': {'index': {'refresh_interval': '-1'}}},
+    )
+
+
+class RacingElasticSearch(FakeElasticSearch):
+    """Someone else creates the index between our GET and PUT."""
+
+    def __call__(self, elasticsearch_url, path, body=None, method='GET'):
+        if method == 'PUT' and '/' not in path:
+            self.requests.append((method, path, body))
+            self.settings[path] = {'refresh_interval': '1s'}
+            raise HTTPError(path, 400, 'Bad Request', {}, io.BytesIO(
+                b'{"error":"IndexAlreadyExistsException[[%s] already '
+                b'exists]","status":400}' % path.encode('utf-8'),
+            ))
+        return super(RacingElasticSearch, self).__call__(
+            elasticsearch_url, path, body, method,
+        )
+
+
+def test_relax_refresh_interval_created_concurrently(monkeypatch):
+    elasticsearch = RacingElasticSearch()
+    monkeypatch.setattr('backfill.request', elasticsearch)
+    previous = relax_refresh_interval('http://es', 'docker-2016-10-19')
+    assert previous == '1s'
+    # Falls back to updating the settings of the existing index.
+    assert elasticsearch.requests[-1] == (
+        'PUT', 'docker-2016-10-19/_settings',
+        {'index': {'refresh_interval': '-1'}},
+    )
+
+
+def test_restore_refresh_interval(monkeypatch):
+    elasticsearch = FakeElasticSearch()
+    monkeypatch.setattr('backfill.request', elasticsearch)
+    restore_refresh_interval('http://es', 'docker-2016-10-19', '5s')
+    assert elasticsearch.requests == [
+        ('PUT', 'docker-2016-10-19/_settings',
+         {'index': {'refresh_interval': '5s'}}),
+        ('POST', 'docker-2016-10-19/_refresh', b''),
+    ]
+
+
+def test_backfill_counts_failures(monkeypatch, tmpdir):
+    elasticsearch = FakeElasticSearch(failures=3)
+    monkeypatch.setattr('backfill.request', elasticsearch)
+    path = write_archive(tmpdir, '%s-json.log.gz' % CONTAINER_ID, [
+        json_file_record('Line %d.' % i, '2016-10-19T12:00:%02dZ' % i)
+        for i in range(25)
+    ])
+    indexed, errors = backfill('http://es', [path], 'docker',
+                               workers=2, batch_size=10)
+    assert indexed == 22
+    assert len(errors) == 3
+    # Refreshes are restored even though some documents failed.
+    assert ('PUT', 'docker-2016-10-19/_settings', {
+        'index': {'refresh_interval': '1s'},
+    }) in elasticsearch.requests
+
+
+def test_backfill_restores_every_index(monkeypatch, tmpdir):
+    elasticsearch = FakeElasticSearch()
+
+    def request(elasticsearch_url, path, body=None, method='GET'):
+        if path == 'docker-2016-10-19/_refresh':
+            raise HTTPError(path, 503, 'Service Unavailable', {}, None)
+        return elasticsearch(elasticsearch_url, path, body, method)
+    monkeypatch.setattr('backfill.request', request)
+    path = write_archive(tmpdir, '%s-json.log.gz' % CONTAINER_ID, [
+        json_file_record('a', '2016-10-19T12:00:00Z'),
+        json_file_record('b', '2016-10-20T12:00:00Z'),
+    ])
+    with pytest.raises(HTTPError):
+        backfill('http://es', [path], 'docker')
+    # The failure on the first index doesn't prevent restoring the next one.
+    assert elasticsearch.requests[-2:] == [
+        ('PUT', 'docker-2016-10-20/_settings',
+         {'index': {'refresh_interval': '1s'}}),
+        ('POST', 'docker-2016-10-20/_refresh', b''),
+    ]
+
+
+def delete_index(elasticsearch, index):
+    try:
+        request(elasticsearch, index, method='DELETE')
+    except HTTPError as error:
+        if error.code != 404:
+            raise
+
+
+def test_backfill_elasticsearch(elasticsearch, tmpdir):
+    """Documents land in daily indices, refreshes are restored."""
+
+    indices = ['docker-2001-01-01', 'docker-2001-01-02']
+    for index in indices:
+        delete_index(elasticsearch, index)
+    # One of the indices already exists, with its own refresh interval.
+    request(elasticsearch, indices[1], {
+        'settings': {'index': {'refresh_interval': '5s'}},
+    }, method='PUT')
+
+    path = write_archive(tmpdir, '%s-json.log.gz' % CONTAINER_ID, [
+        json_file_record('Line %d.' % i, '2001-01-0%dT12:00:%02dZ' % (
+            1 + i % 2, i,
+        ))
+        for i in range(10)
+    ])
+    try:
+        indexed, errors = backfill(elasticsearch, [path], 'docker',
+                                   workers=2, batch_size=3)
+        assert (indexed, errors) == (10, [])
+
+        for index, refresh_interval in zip(indices, ['1s', '5s']):
+            body = request(elasticsearch, '%s/docker/_search' % index)
+            assert body['hits']['total'] == 5
+            assert {hit['_source']['@timestamp'][:10]
+                    for hit in body['hits']['hits']} == {index[7:]}
+            body = request(elasticsearch, '%s/_settings' % index)
+            assert body[index]['settings']['index'][
+                'refresh_interval'
+            ] == refresh_interval
+    finally:
+        for index in indices:
+            delete_index(elasticsearch, index)
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+
+
+import aiohttp
+import asyncio
+import datetime
+import hashlib
+import io
+import json
+import os.path
+import pytest
+import shutil
+import tarfile
+import timeit
+import uuid
+
+from fluent.sender import FluentSender
+from test_connectivity import FLASK_WORKLOAD
+from urllib.parse import urljoin
+
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def generate_artifact(size, chunk_size=1 * MB):
+    """Produce ``size`` bytes of payload, one chunk at a time."""
+    chunk = bytes(range(256)) * (chunk_size // 256)
+    while size > 0:
+        yield chunk[:size]
+        size -= len(chunk)
+
+
+def report(label, size, duration):
+    print('%s: %d bytes in %.3f s (%.1f MB/s)' % (
+        label, size, duration, (size / MB) / duration,
+    ))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('size', [
+    1 * MB,
+    16 * MB,
+    256 * MB,
+    1 * GB,
+])
+async def test_fileserver_throughput(benchmark, fileserver, http_client, size):
+    """Measure fileserver throughput for slug-sized artifacts."""
+
+    url = urljoin(fileserver, 'benchmark-%d.bin' % size)
+
+    # Stream the upload, hashing as we go to keep memory usage constant.  The
+    # length is known up front: send a plain PUT (like `test_fileserver_flow`)
+    # rather than rely on chunked transfer encoding.
+    expected = hashlib.sha256()
+
+    def stream():
+        for chunk in generate_artifact(size):
+            expected.update(chunk)
+            yield chunk
+    head = {
+        'Content-Length': str(size),
+    }
+    ref = timeit.default_timer()
+    async with http_client.put(url, headers=head, data=stream()) as resp:
+        assert resp.status in (201, 204)
+    report('PUT', size, timeit.default_timer() - ref)
+
+    # Stream the download, never holding more than one chunk in memory.
+    actual = hashlib.sha256()
+    ref = timeit.default_timer()
+    async with http_client.get(url) as resp:
+        assert resp.status == 200
+        while True:
+            chunk = await resp.content.read(1 * MB)
+            if not chunk:
+                break
+            actual.update(chunk)
+    report('GET', size, timeit.default_timer() - ref)
+    assert actual.hexdigest() == expected.hexdigest()
+
+    # Don't leave large files lying around on the storage volume (best
+    # effort: the fileserver's DELETE support isn't part of what's measured).
+    async with http_client.delete(url) as resp:
+        if resp.status not in (200, 204):
+            print('Could not delete "%s" (HTTP %d).' % (url, resp.status))
+
+
+async def git(*args, cwd):
+    """Run a Git command, fail if it doesn't succeed."""
+    child = await asyncio.create_subprocess_exec(
+        'git', *args, cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+    output, _ = await child.communicate()
+    assert child.returncode == 0, output
+
+
+@pytest.mark.asyncio
+async def test_gitmesh_concurrent_pushes(benchmark, docker_ip, http_client,
+                                         tmpdir):
+    """Measure push-to-deploy throughput when pushing to many repos at once."""
+
+    count = 50
+    names = ['stress-%02d' % i for i in range(count)]
+    async with http_client.get('http://%s:8080/' % docker_ip) as resp:
+        assert resp.status == 200
+        gitmesh = await resp.json()
+    async with http_client.get('http://%s:8081/' % docker_ip) as resp:
+        assert resp.status == 200
+        agent = await resp.json()
+
+    async def list_processes():
+        async with http_client.get(agent['list']) as resp:
+            assert resp.status == 200
+            listing = await resp.json()
+        return listing['processes']
+
+    # Remove repositories left behind by an interrupted run.
+    async with http_client.get(gitmesh['list']) as resp:
+        assert resp.status == 200
+        listing = await resp.json()
+    for repo in listing['repositories']:
+        if repo['name'].startswith('stress-'):
+            async with http_client.delete(repo['delete']) as resp:
+                assert resp.status == 200
+
+    # Only clean up processes started by this test.
+    existing = {process['details'] for process in await list_processes()}
+
+    # Create the repositories.
+    repos = []
+
+    async def create(name):
+        body = json.dumps({'name': name})
+        async with http_client.post(gitmesh['create'], data=body) as resp:
+            assert resp.status == 201
+            repo = await resp.json()
+        repos.append(repo)
+        return repo
+
+    # Prepare a commit for each one.
+    async def prepare(repo):
+        path = str(tmpdir.join(repo['name']))
+        shutil.copytree(os.path.join(
+            here, '..', 'features', 'samples', 'hello-world',
+        ), path)
+        await git('init', '.', cwd=path)
+        await git('config', 'user.name', 'pytest', cwd=path)
+        await git('config', 'user.email', 'noreply@smartmob.org', cwd=path)
+        await git('add', '.', cwd=path)
+        await git('commit', '-m', 'Adds sample.', cwd=path)
+        return path
+
+    # Push them all at once (this triggers the deploy hook in gitmesh).
+    async def push(repo, path):
+        ref = timeit.default_timer()
+        await git('push', repo['clone'][0], 'HEAD:master', cwd=path)
+        return timeit.default_timer() - ref
+
+    async def gather(*coroutines):
+        """Let all coroutines finish (so cleanup sees every repository)."""
+        results = await asyncio.gather(*coroutines, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    try:
+        await gather(*(create(name) for name in names))
+        paths = await gather(*(prepare(repo) for repo in repos))
+        ref = timeit.default_timer()
+        latencies = await gather(*(
+            push(repo, path) for repo, path in zip(repos, paths)
+        ))
+        duration = timeit.default_timer() - ref
+    finally:
+        for repo in repos:
+            async with http_client.delete(repo['delete']) as resp:
+                assert resp.status == 200
+        for process in await list_processes():
+            if process['details'] in existing:
+                continue
+            async with http_client.post(process['delete']) as resp:
+                assert resp.status == 200
+
+    latencies = sorted(latencies)
+    print('%d pushes in %.3f s (%.1f pushes/s)' % (
+        count, duration, count / duration,
+    ))
+    print('Push latency: min=%.3f s, median=%.3f s, max=%.3f s' % (
+        latencies[0], latencies[count // 2], latencies[-1],
+    ))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('codec', ['', 'gz', 'bz2', 'xz'])
+async def test_slug_codecs(benchmark, fileserver, http_client, tmpdir, codec):
+    """Compare slug compression codecs from packing to unpacking."""
+
+    # Build a slug from the sample application and a real dependency tree.
+    ref = timeit.default_timer()
+    slug = io.BytesIO()
+    with tarfile.open(fileobj=slug, mode='w:' + codec) as archive:
+        archive.add(os.path.join(
+            here, '..', 'features', 'samples', 'hello-world',
+        ), arcname='.')
+        archive.add(os.path.dirname(aiohttp.__file__), arcname='aiohttp')
+    pack_time = timeit.default_timer() - ref
+    slug = slug.getvalue()
+
+    # Round trip through the fileserver.
+    url = urljoin(fileserver, 'benchmark-slug.tar.%s' % (codec or 'none'))
+    ref = timeit.default_timer()
+    async with http_client.put(url, data=slug) as resp:
+        assert resp.status in (201, 204)
+    async with http_client.get(url) as resp:
+        assert resp.status == 200
+        body = await resp.read()
+    transfer_time = timeit.default_timer() - ref
+    assert body == slug
+
+    # Don't leave slugs lying around on the storage volume (best effort, see
+    # `test_fileserver_throughput`).
+    async with http_client.delete(url) as resp:
+        if resp.status not in (200, 204):
+            print('Could not delete "%s" (HTTP %d).' % (url, resp.status))
+
+    # Unpack, detecting the codec from the archive header.
+    ref = timeit.default_timer()
+    with tarfile.open(fileobj=io.BytesIO(body), mode='r:*') as archive:
+        archive.extractall(str(tmpdir))
+    unpack_time = timeit.default_timer() - ref
+
+    print('%-4s size=%d pack=%.3f s transfer=%.3f s unpack=%.3f s' % (
+        codec or 'none', len(slug), pack_time, transfer_time, unpack_time,
+    ))
+
+
+async def quiet_container_latency(elasticsearch, http_client, docker_ip):
+    """Time how long a single line takes to show up in search results.
+
+    The coalescing stage in `fluent.conf` holds on to a line until the
+    container logs the next one (or until its flush timeout), so a second
+    line follows right away to flush the first one: only the pipeline's
+    own latency is measured.
+    """
+    today = datetime.date.today()
+    marker = uuid.uuid4().hex
+    fluent = FluentSender('docker.quiet', host=docker_ip, port=24224)
+    ref = timeit.default_timer()
+    for line in ('Hello, world!', 'Goodbye, world!'):
+        fluent.emit('', {
+            'container_name': 'quiet',
+            'container_id': marker,
+            'source': 'stdout',
+            'log': line,
+        })
+    url = urljoin(elasticsearch, 'docker-%s/docker/_search?q=%s' % (
+        today.isoformat(), 'container_id:%s' % marker,
+    ))
+    while True:
+        async with http_client.get(url) as resp:
+            body = await resp.json()
+        if resp.status == 200 and body['hits']['total'] > 0:
+            return timeit.default_timer() - ref
+        assert timeit.default_timer() - ref < 30.0
+        await asyncio.sleep(0.1)
+
+
+@pytest.mark.asyncio
+async def test_fluentd_noisy_container(benchmark, elasticsearch, http_client,
+                                       docker_ip, event_loop):
+    """A chatty container doesn't delay other containers' logs."""
+
+    # Measure the ingest latency on an idle pipeline first.
+    baseline = await quiet_container_latency(
+        elasticsearch, http_client, docker_ip,
+    )
+
+    # Flood the pipeline from one container.
+    def flood(count):
+        fluent = FluentSender('docker.noisy', host=docker_ip, port=24224)
+        for i in range(count):
+            fluent.emit('', {
+                'container_name': 'noisy',
+                'container_id': 'noisy',
+                'source': 'stdout',
+                'log': 'Line %d.' % i,
+            })
+    flooding = event_loop.run_in_executor(None, flood, 100000)
+
+    # Meanwhile, log from another container.
+    await asyncio.sleep(1.0)
+    flooded = await quiet_container_latency(
+        elasticsearch, http_client, docker_ip,
+    )
+    await flooding
+
+    print('Quiet container ingest latency: %.3f s (idle: %.3f s)' % (
+        flooded, baseline,
+    ))
+    # Throttling should keep the flood from doubling the idle latency (plus
+    # some slack for ElasticSearch's 1 s flush & refresh intervals).
+    assert flooded < 2.0 * baseline + 1.0
+
+
+@pytest.mark.asyncio
+async def test_fluentd_multiline_coalescing(benchmark, elasticsearch,
+                                            http_client, docker_ip):
+    """Report how much the coalescing stage reduces the document count."""
+
+    today = datetime.date.today()
+    marker = uuid.uuid4().hex
+    fluent = FluentSender('docker.test', host=docker_ip, port=24224)
+    for line in FLASK_WORKLOAD:
+        fluent.emit('', {
+            'container_name': 'a-container-name',
+            'container_id': marker,
+            'source': 'stderr',
+            'log': line,
+        })
+
+    # Wait for the coalescing stage to time out (the last record is held
+    # until then) and for records to show up in search results.
+    await asyncio.sleep(5.0)
+    url = urljoin(elasticsearch, 'docker-%s/docker/_search?q=%s' % (
+        today.isoformat(), 'container_id:%s&size=0' % marker,
+    ))
+    async with http_client.get(url) as resp:
+        assert resp.status == 200
+        body = await resp.json()
+    documents = body['hits']['total']
+    print('%d lines shipped as %d documents (%.0f%% reduction)' % (
+        len(FLASK_WORKLOAD), documents,
+        100.0 * (1.0 - documents / len(FLASK_WORKLOAD)),
+    ))
+
+
+@pytest.mark.asyncio
+async def test_fluentd_standin_throughput(benchmark, fluentd, event_loop):
+    """Measure routing throughput without containers."""
+
+    count = 10000
+    today = datetime.datetime.utcnow().date()
+
+    def emit():
+        sender = FluentSender('events.test', port=fluentd.forward_port)
+        for i in range(count):
+            sender.emit('an-event', {'i': i})
+    ref = timeit.default_timer()
+    await event_loop.run_in_executor(None, emit)
+    index = 'events-%s' % today.isoformat()
+    while len(fluentd.elasticsearch.search(index)) < count:
+        assert timeit.default_timer() - ref < 30.0
+        await asyncio.sleep(0.001)
+    duration = timeit.default_timer() - ref
+    print('%d records routed in %.3f s (%.0f records/s)' % (
+        count, duration, count / duration,
+    ))
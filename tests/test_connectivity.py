@@ -5,12 +5,34 @@ import asyncio
 import datetime
 import pytest
 import json
+import timeit
+import uuid
 
 from fluent.sender import FluentSender
 from unittest import mock
 from urllib.parse import urljoin
 
 
+async def search_until_found(http_client, url, timeout=15.0):
+    """Poll a search URL until it has hits or the deadline expires.
+
+    Docker records are held back by the multi-line coalescing stage in
+    `fluent.conf` until the next line or its flush timeout, so the delay
+    before a record is searchable varies.
+    """
+    deadline = timeit.default_timer() + timeout
+    while True:
+        async with http_client.get(url) as resp:
+            # The index doesn't exist until the first record is indexed.
+            assert resp.status in (200, 404)
+            body = await resp.json()
+        if resp.status == 200 and body['hits']['total'] > 0:
+            return body
+        if timeit.default_timer() >= deadline:
+            return body
+        await asyncio.sleep(0.5)
+
+
 @pytest.mark.asyncio
 async def test_elasticsearch_docker_index_template(elasticsearch, http_client):
     """ElasticSearch index templates are provisionned by the setup process."""
@@ -47,6 +69,10 @@ async def test_elasticsearch_events_index_template(elasticsearch, http_client):
     fields = mappings['events']['properties']
     assert fields['service']['type'] == 'string'
     assert fields['event']['type'] == 'string'
+    assert fields['correlation_id']['type'] == 'string'
+    assert fields['duration']['type'] == 'double'
+    assert fields['sampled']['type'] == 'long'
+    assert fields['dropped']['type'] == 'long'
 
 
 @pytest.mark.asyncio
@@ -359,6 +385,11 @@ async def test_kibana_events_index_pattern(elasticsearch, http_client):
     assert fields['service']['analyzed'] is False
     assert fields['event']['type'] == 'string'
     assert fields['event']['analyzed'] is False
+    assert fields['correlation_id']['type'] == 'string'
+    assert fields['correlation_id']['analyzed'] is False
+    assert fields['duration']['type'] == 'number'
+    assert fields['sampled']['type'] == 'number'
+    assert fields['dropped']['type'] == 'number'
 
 
 @pytest.mark.asyncio
@@ -382,6 +413,10 @@ async def test_fluentd_http_source_docker(elasticsearch, http_client,
     # want to get flakey results when we execute the tests around midnight).
     today = datetime.date.today()
 
+    # Use a unique container ID: records from previous tests may still be
+    # held back by the coalescing stage and land in the index at any time.
+    container_id = uuid.uuid4().hex
+
     # Clear the index.
     url = urljoin(elasticsearch, 'docker-%s' % (
         today.isoformat(),
@@ -395,7 +430,7 @@ async def test_fluentd_http_source_docker(elasticsearch, http_client,
     url = 'http://%s:8888/docker.test' % (docker_ip,)
     body = 'json=' + json.dumps({
         'container_name': 'a-container-name',
-        'container_id': 'a-container-id',
+        'container_id': container_id,
         'source': 'stdout',
         'log': 'Hello, world!',
     })
@@ -407,19 +442,16 @@ async def test_fluentd_http_source_docker(elasticsearch, http_client,
         body = await resp.text()
 
     # Wait until the record shows up in search results.
-    await asyncio.sleep(datetime.timedelta(seconds=3).total_seconds())
-
-    # Grab the record.
     url = urljoin(elasticsearch, 'docker-%04d-%02d-%02d/docker/_search' % (
         today.year, today.month, today.day,
     ))
-    async with http_client.get(url) as resp:
-        assert resp.status == 200
-        body = await resp.json()
+    body = await search_until_found(
+        http_client, url + '?q=container_id:%s' % container_id,
+    )
     assert body['hits']['total'] == 1
     assert body['hits']['hits'][0]['_source'] == {
         'container_name': 'a-container-name',
-        'container_id': 'a-container-id',
+        'container_id': container_id,
         'source': 'stdout',
         'log': 'Hello, world!',
         '@timestamp': mock.ANY,
@@ -520,6 +552,10 @@ async def test_fluentd_forward_source_docker(elasticsearch, http_client,
     # want to get flakey results when we execute the tests around midnight).
     today = datetime.date.today()
 
+    # Use a unique container ID: records from previous tests may still be
+    # held back by the coalescing stage and land in the index at any time.
+    container_id = uuid.uuid4().hex
+
     # Clear the index.
     url = urljoin(elasticsearch, 'docker-%s' % (
         today.isoformat(),
@@ -533,25 +569,22 @@ async def test_fluentd_forward_source_docker(elasticsearch, http_client,
     fluent = FluentSender('docker.test', host=docker_ip, port=24224)
     fluent.emit('', {
         'container_name': 'a-container-name',
-        'container_id': 'a-container-id',
+        'container_id': container_id,
         'source': 'stdout',
         'log': 'Hello, world!',
     })
 
     # Wait until the record shows up in search results.
-    await asyncio.sleep(datetime.timedelta(seconds=3).total_seconds())
-
-    # Grab the record.
     url = urljoin(elasticsearch, 'docker-%04d-%02d-%02d/docker/_search' % (
         today.year, today.month, today.day,
     ))
-    async with http_client.get(url) as resp:
-        assert resp.status == 200
-        body = await resp.json()
+    body = await search_until_found(
+        http_client, url + '?q=container_id:%s' % container_id,
+    )
     assert body['hits']['total'] == 1
     assert body['hits']['hits'][0]['_source'] == {
         'container_name': 'a-container-name',
-        'container_id': 'a-container-id',
+        'container_id': container_id,
         'source': 'stdout',
         'log': 'Hello, world!',
         '@timestamp': mock.ANY,
@@ -637,6 +670,121 @@ async def test_fluentd_forward_source_events(elasticsearch, http_client,
     assert int(index['docs.count']) >= 1
 
 
+# Output of the hello-world sample serving a few requests, one of which
+# fails with a chained exception.
+FLASK_WORKLOAD = [
+    ' * Running on http://0.0.0.0:8081/ (Press CTRL+C to quit)',
+    '10.0.0.1 - - [19/Oct/2016 12:00:00] "GET / HTTP/1.1" 200 -',
+    'Traceback (most recent call last):',
+    '  File "hello.py", line 12, in hello',
+    '    return greetings[name]',
+    "KeyError: 'world'",
+    '',
+    'During handling of the above exception, another exception occurred:',
+    '',
+    'Traceback (most recent call last):',
+    '  File "flask/app.py", line 1817, in wsgi_app',
+    '    response = self.full_dispatch_request()',
+    '  File "flask/app.py", line 1477, in full_dispatch_request',
+    '    rv = self.handle_user_exception(e)',
+    'RuntimeError: unhandled error',
+    '10.0.0.1 - - [19/Oct/2016 12:00:01] "GET / HTTP/1.1" 500 -',
+    '10.0.0.1 - - [19/Oct/2016 12:00:02] "GET / HTTP/1.1" 200 -',
+]
+
+
+@pytest.mark.asyncio
+async def test_fluentd_multiline_coalescing(elasticsearch, http_client,
+                                            docker_ip):
+    """Continuation lines are shipped as part of the record they belong to."""
+
+    today = datetime.date.today()
+    marker = uuid.uuid4().hex
+    fluent = FluentSender('docker.test', host=docker_ip, port=24224)
+    for line in FLASK_WORKLOAD:
+        fluent.emit('', {
+            'container_name': 'a-container-name',
+            'container_id': marker,
+            'source': 'stderr',
+            'log': line,
+        })
+
+    # Wait for the coalescing stage to time out and for records to show up
+    # in search results.
+    ref = timeit.default_timer()
+    url = urljoin(elasticsearch, 'docker-%s/docker/_search?q=%s' % (
+        today.isoformat(), 'container_id:%s&size=100' % marker,
+    ))
+    while True:
+        async with http_client.get(url) as resp:
+            body = await resp.json()
+        if resp.status == 200 and body['hits']['total'] >= 6:
+            break
+        if timeit.default_timer() - ref > 15.0:
+            break
+        await asyncio.sleep(0.5)
+    assert resp.status == 200
+    documents = body['hits']['total']
+    assert documents == 6
+    logs = {hit['_source']['log'] for hit in body['hits']['hits']}
+    assert '\n'.join(FLASK_WORKLOAD[2:9]) in logs
+    assert '\n'.join(FLASK_WORKLOAD[9:15]) in logs
+
+
+@pytest.mark.asyncio
+async def test_fluentd_docker_throttle(elasticsearch, http_client, docker_ip):
+    """Lines over a container's rate limit are sampled and summarized."""
+
+    today = datetime.date.today()
+
+    # Log well over the burst (1000 lines) in one go.
+    count = 3000
+    container_name = uuid.uuid4().hex
+    fluent = FluentSender('docker.test', host=docker_ip, port=24224)
+    for i in range(count):
+        fluent.emit('', {
+            'container_name': container_name,
+            'container_id': container_name,
+            'source': 'stdout',
+            'log': 'Line %d.' % i,
+        })
+
+    # Summaries are emitted every minute, wait until they account for every
+    # line that didn't get indexed (a flood that straddles two summaries
+    # shows up in both).
+    summaries_url = urljoin(elasticsearch, 'events-%s/events/_search?q=%s' % (
+        today.isoformat(), 'container_name:%s&size=100' % container_name,
+    ))
+    documents_url = urljoin(elasticsearch, 'docker-%s/docker/_search?q=%s' % (
+        today.isoformat(), 'container_name:%s&size=0' % container_name,
+    ))
+    deadline = timeit.default_timer() + 150.0
+    while True:
+        async with http_client.get(summaries_url) as resp:
+            assert resp.status in (200, 404)
+            body = await resp.json()
+        summaries = [
+            hit['_source'] for hit in body.get('hits', {}).get('hits', [])
+        ]
+        dropped = sum(summary['dropped'] for summary in summaries)
+        async with http_client.get(documents_url) as resp:
+            assert resp.status == 200
+            body = await resp.json()
+        indexed = body['hits']['total']
+        if summaries and indexed + dropped == count:
+            break
+        assert timeit.default_timer() < deadline
+        await asyncio.sleep(1.0)
+
+    assert dropped > 0
+    for summary in summaries:
+        assert summary['service'] == 'fluentd'
+        assert summary['event'] == 'throttle'
+        # 1 in 100 lines over the limit is kept, the rest is dropped.
+        overflow = summary['sampled'] + summary['dropped']
+        assert summary['sampled'] == (overflow + 99) // 100
+
+
 @pytest.mark.asyncio
 async def test_gitmesh(docker_ip, http_client):
     async with http_client.get('http://%s:8080/' % docker_ip) as resp:
@@ -663,3 +811,32 @@ async def test_fileserver_flow(docker_ip, http_client):
         assert resp.status == 200
         assert json.dumps(await resp.json()) == payload
         print(await resp.json())
+
+
+@pytest.mark.asyncio
+async def test_livetail(docker_ip, http_client):
+    """Records are streamed live, without waiting for ElasticSearch."""
+
+    url = 'http://%s:8083/tail?tag=events.test.**' % docker_ip
+    async with http_client.get(url) as resp:
+        assert resp.status == 200
+        assert resp.headers['Content-Type'] == 'text/event-stream'
+
+        # Post an event with a tag that matches the subscription.
+        ref = timeit.default_timer()
+        fluent = FluentSender('events.test', host=docker_ip, port=24224)
+        fluent.emit('an-event', {
+            'some-field': 'some-value',
+        })
+
+        # Wait for it to show up in the stream.
+        line = await asyncio.wait_for(resp.content.readline(), 5.0)
+        print('Live tail latency: %.3f s' % (timeit.default_timer() - ref))
+    assert line.startswith(b'data: ')
+    event = json.loads(line[6:].decode('utf-8'))
+    assert event['tag'] == 'events.test.an-event'
+    assert event['record'] == {
+        'service': 'test',
+        'event': 'an-event',
+        'some-field': 'some-value',
+    }
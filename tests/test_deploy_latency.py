@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+
+import pytest
+
+from deploy_latency import (
+    BUCKETS,
+    collect_traces,
+    histogram,
+    parse_timestamp,
+    percentile,
+    report,
+    stage_durations,
+)
+
+
+def synthetic_trace(correlation_id='a-deploy'):
+    """Events of one deploy, as they come out of ElasticSearch."""
+    return [
+        {
+            'correlation_id': correlation_id,
+            'service': 'gitmesh',
+            'event': 'push',
+            '@timestamp': '2016-10-19T12:00:00Z',
+        },
+        {
+            'correlation_id': correlation_id,
+            'service': 'gitmesh-deploy',
+            'event': 'build',
+            'duration': 12.5,
+            '@timestamp': '2016-10-19T14:00:15+02:00',
+        },
+        {
+            'correlation_id': correlation_id,
+            'service': 'smartmob-agent',
+            'event': 'start',
+            '@timestamp': '2016-10-19T07:00:20.250-05:00',
+        },
+    ]
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('2016-10-19T12:00:00Z', 1476878400.0),
+    ('2016-10-19T12:00:00', 1476878400.0),
+    ('2016-10-19T12:00:00.250Z', 1476878400.25),
+    ('2016-10-19T14:00:00+02:00', 1476878400.0),
+    ('2016-10-19T07:00:00-05:00', 1476878400.0),
+    ('2016-10-19T12:30:00+0030', 1476878400.0),
+])
+def test_parse_timestamp(value, expected):
+    assert parse_timestamp(value) == pytest.approx(expected)
+
+
+def test_parse_timestamp_invalid():
+    with pytest.raises(ValueError):
+        parse_timestamp('19/Oct/2016 12:00:00')
+
+
+def test_collect_traces():
+    events = synthetic_trace('a') + synthetic_trace('b')
+    events.reverse()
+    traces = collect_traces(events)
+    assert sorted(traces) == ['a', 'b']
+    for trace in traces.values():
+        # Chronological order, regardless of the timezone offsets.
+        assert [event['event'] for event in trace] == [
+            'push', 'build', 'start',
+        ]
+
+
+def test_stage_durations():
+    trace = collect_traces(synthetic_trace())['a-deploy']
+    stages = stage_durations(trace)
+    assert [stage for stage, _ in stages] == [
+        'gitmesh-deploy.build',
+        'smartmob-agent.start',
+    ]
+    # The build records its own duration, the start is deduced from the
+    # previous event.
+    assert stages[0][1] == pytest.approx(12.5)
+    assert stages[1][1] == pytest.approx(5.25)
+
+
+def test_stage_durations_first_event_with_duration():
+    trace = collect_traces(synthetic_trace())['a-deploy']
+    trace[0]['duration'] = 0.5
+    stages = stage_durations(trace)
+    assert stages[0] == ('gitmesh.push', 0.5)
+    assert len(stages) == 3
+
+
+def test_histogram():
+    counts = histogram([0.005, 0.01, 0.2, 3.0, 3600.0])
+    assert len(counts) == len(BUCKETS)
+    assert counts[0] == 2
+    assert counts[2] == 1
+    assert counts[5] == 1
+    assert counts[-1] == 1
+    assert sum(counts) == 5
+
+
+def test_percentile():
+    durations = [float(i) for i in range(1, 101)]
+    assert percentile(durations, 0.50) == 51.0
+    assert percentile(durations, 0.95) == 96.0
+    assert percentile(durations, 1.0) == 100.0
+    assert percentile([3.0], 0.95) == 3.0
+
+
+def test_report_flags_slow_deploys(capsys):
+    traces = collect_traces(
+        synthetic_trace('fast') + synthetic_trace('slow'),
+    )
+    # Make the second deploy take 2 minutes.
+    traces['slow'][-1]['@timestamp'] += 100.0
+    report(traces, slow=60.0)
+    out, _ = capsys.readouterr()
+    assert 'Deploys: 2' in out
+    assert 'gitmesh-deploy.build (n=2,' in out
+    flagged = out.split('Slow deploys (> 60 s):', 1)[1]
+    assert '  slow: 120.250 s' in flagged
+    assert 'fast' not in flagged
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+import datetime
+import gzip
+import json
+import msgpack
+import pytest
+import struct
+import time
+import timeit
+
+from fluent.sender import FluentSender
+from unittest import mock
+
+
+async def wait_for_documents(fluentd, index, count=1, timeout=1.0):
+    """Poll the ElasticSearch stand-in until documents show up."""
+    ref = timeit.default_timer()
+    while len(fluentd.elasticsearch.search(index)) < count:
+        assert timeit.default_timer() - ref < timeout
+        await asyncio.sleep(0.001)
+    return fluentd.elasticsearch.search(index)
+
+
+@pytest.mark.asyncio
+async def test_forward_source_docker(fluentd):
+    """`docker.**` records are indexed as-is in daily indices."""
+
+    today = datetime.datetime.utcnow().date()
+
+    sender = FluentSender('docker.test', port=fluentd.forward_port)
+    sender.emit('', {
+        'container_name': 'a-container-name',
+        'container_id': 'a-container-id',
+        'source': 'stdout',
+        'log': 'Hello, world!',
+    })
+
+    documents = await wait_for_documents(
+        fluentd, 'docker-%s' % today.isoformat(),
+    )
+    assert documents == [{
+        'container_name': 'a-container-name',
+        'container_id': 'a-container-id',
+        'source': 'stdout',
+        'log': 'Hello, world!',
+        '@timestamp': mock.ANY,
+    }]
+    hits = fluentd.elasticsearch.indices['docker-%s' % today.isoformat()]
+    assert hits[0]['_type'] == 'docker'
+
+
+async def send_message(fluentd, message, use_bin_type=True, ack=False):
+    """Send one raw forward protocol message, return the ack (if any)."""
+    reader, writer = await asyncio.open_connection(
+        '127.0.0.1', fluentd.forward_port,
+    )
+    try:
+        writer.write(msgpack.packb(message, use_bin_type=use_bin_type))
+        if ack:
+            unpacker = msgpack.Unpacker(raw=False)
+            unpacker.feed(await asyncio.wait_for(reader.read(1024), 1.0))
+            return next(unpacker)
+    finally:
+        writer.close()
+
+
+def pack_entries(*entries):
+    return b''.join(msgpack.packb(entry) for entry in entries)
+
+
+@pytest.mark.asyncio
+async def test_forward_mode(fluentd):
+    """Forward mode carries several entries in one message."""
+
+    today = datetime.datetime.utcnow().date()
+    now = int(time.time())
+
+    await send_message(fluentd, ['events.test.an-event', [
+        [now, {'i': 1}],
+        # EventTime (seconds & nanoseconds).
+        [msgpack.ExtType(0, struct.pack('>II', now, 500000000)), {'i': 2}],
+    ]])
+
+    documents = await wait_for_documents(
+        fluentd, 'events-%s' % today.isoformat(), count=2,
+    )
+    assert [document['i'] for document in documents] == [1, 2]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('compressed', [False, True])
+async def test_packed_forward_mode(fluentd, compressed):
+    """PackedForward mode carries a msgpack stream of entries."""
+
+    today = datetime.datetime.utcnow().date()
+    now = int(time.time())
+
+    entries = pack_entries([now, {'i': 1}], [now, {'i': 2}])
+    options = {}
+    if compressed:
+        entries = gzip.compress(entries)
+        options['compressed'] = 'gzip'
+    await send_message(fluentd, ['events.test.an-event', entries, options])
+
+    documents = await wait_for_documents(
+        fluentd, 'events-%s' % today.isoformat(), count=2,
+    )
+    assert [document['i'] for document in documents] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_packed_forward_mode_str(fluentd):
+    """Older clients send the entries with a str header."""
+
+    today = datetime.datetime.utcnow().date()
+    now = int(time.time())
+
+    # Binary payload that isn't valid UTF-8 (gzip header).
+    entries = gzip.compress(pack_entries([now, {'i': 1}]))
+    await send_message(fluentd, [
+        'events.test.an-event', entries, {'compressed': 'gzip'},
+    ], use_bin_type=False)
+
+    documents = await wait_for_documents(
+        fluentd, 'events-%s' % today.isoformat(),
+    )
+    assert [document['i'] for document in documents] == [1]
+
+
+@pytest.mark.asyncio
+async def test_ack(fluentd):
+    """Chunks are acknowledged when the client asks for it."""
+
+    now = int(time.time())
+
+    response = await send_message(fluentd, [
+        'events.test.an-event', [[now, {'i': 1}]], {'chunk': 'abc123'},
+    ], ack=True)
+    assert response == {'ack': 'abc123'}
+
+
+@pytest.mark.asyncio
+async def test_forward_source_events(fluentd):
+    """`events.**` records get `service` and `event` from the tag."""
+
+    today = datetime.datetime.utcnow().date()
+
+    sender = FluentSender('events.test', port=fluentd.forward_port)
+    sender.emit('an-event', {
+        'some-field': 'some-value',
+    })
+
+    documents = await wait_for_documents(
+        fluentd, 'events-%s' % today.isoformat(),
+    )
+    assert documents == [{
+        'service': 'test',
+        'event': 'an-event',
+        'some-field': 'some-value',
+        '@timestamp': mock.ANY,
+    }]
+    hits = fluentd.elasticsearch.indices['events-%s' % today.isoformat()]
+    assert hits[0]['_type'] == 'events'
+
+
+@pytest.mark.asyncio
+async def test_http_source_events(fluentd, http_client):
+    """The HTTP source routes records like the forward source."""
+
+    today = datetime.datetime.utcnow().date()
+
+    url = '%s/events.test.an-event' % fluentd.http_url
+    body = 'json=' + json.dumps({
+        'some-field': 'some-value',
+    })
+    head = {
+        'Content-Type': 'application/x-www-form-urlencoded',
+    }
+    async with http_client.post(url, headers=head, data=body) as resp:
+        assert resp.status == 200
+
+    documents = await wait_for_documents(
+        fluentd, 'events-%s' % today.isoformat(),
+    )
+    assert documents == [{
+        'service': 'test',
+        'event': 'an-event',
+        'some-field': 'some-value',
+        '@timestamp': mock.ANY,
+    }]
+
+
+@pytest.mark.asyncio
+async def test_unmatched_tag(fluentd):
+    """Records that match no rule are not indexed."""
+
+    sender = FluentSender('other.test', port=fluentd.forward_port)
+    sender.emit('', {'some-field': 'some-value'})
+    sender.emit('', {'some-field': 'some-value'})
+
+    ref = timeit.default_timer()
+    while len(fluentd.router.unmatched) < 2:
+        assert timeit.default_timer() - ref < 1.0
+        await asyncio.sleep(0.001)
+    assert fluentd.elasticsearch.indices == {}
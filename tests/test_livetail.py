@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+
+import json
+
+from livetail import Client, Hub, render
+
+
+def drain(client):
+    items = []
+    while not client.queue.empty():
+        items.append(client.queue.get_nowait())
+    return items
+
+
+def test_hub_fans_out_by_tag():
+    hub = Hub()
+    events = Client(['events.**'], buffer_size=10)
+    docker = Client(['docker.*'], buffer_size=10)
+    hub.clients.update({events, docker})
+
+    hub.publish('events.test.an-event', 1.0, {'i': 1})
+    hub.publish('docker.test', 2.0, {'i': 2})
+
+    assert drain(events) == [('events.test.an-event', 1.0, {'i': 1})]
+    assert drain(docker) == [('docker.test', 2.0, {'i': 2})]
+
+
+def test_hub_drops_slow_consumer():
+    hub = Hub()
+    slow = Client(['events.**'], buffer_size=2)
+    fast = Client(['events.**'], buffer_size=10)
+    hub.clients.update({slow, fast})
+
+    for i in range(4):
+        hub.publish('events.test', float(i), {'i': i})
+
+    # The slow client is cut off: it gets the sentinel in place of its
+    # oldest record and never hears from the hub again.
+    assert slow.dropped
+    assert hub.clients == {fast}
+    assert drain(slow) == [('events.test', 1.0, {'i': 1}), None]
+
+    # Others are not held up.
+    assert not fast.dropped
+    assert [item[2]['i'] for item in drain(fast)] == [0, 1, 2, 3]
+
+
+def test_render():
+    event = render(('events.test', 1.5, {'i': 1}))
+    assert event.startswith(b'data: ')
+    assert event.endswith(b'\n\n')
+    assert json.loads(event[6:].decode('utf-8')) == {
+        'tag': 'events.test',
+        'time': 1.5,
+        'record': {'i': 1},
+    }
+
+
+def test_render_dropped():
+    assert render(None) == b'event: dropped\ndata: {}\n\n'
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+
+import pytest
+
+from push_to_deploy import hot_functions, load_stacks
+
+
+def write_stacks(folder, name, lines):
+    path = folder.join(name)
+    path.write('\n'.join(lines) + '\n')
+    return str(path)
+
+
+def test_load_stacks(tmpdir):
+    path = write_stacks(tmpdir, 'gitmesh.txt', [
+        'process 1:"python -m gitmesh";main (gitmesh/__main__.py:10) 3',
+        'main (gitmesh/__main__.py:10);serve (gitmesh/server.py:42) 7',
+        'garbage',
+        '',
+    ])
+    assert list(load_stacks(path)) == [
+        (['process 1:"python -m gitmesh"', 'main (gitmesh/__main__.py:10)'],
+         3),
+        (['main (gitmesh/__main__.py:10)', 'serve (gitmesh/server.py:42)'],
+         7),
+    ]
+
+
+def test_hot_functions(tmpdir):
+    profiles = [
+        ('gitmesh', write_stacks(tmpdir, 'gitmesh.txt', [
+            'process 1:"python";main;serve 6',
+            'process 1:"python";main 2',
+            # Recursion counts once towards total time.
+            'main;main;serve 1',
+            # Only a process frame.
+            'process 2:"git" 5',
+        ])),
+        ('fileserver', write_stacks(tmpdir, 'fileserver.txt', [
+            'main;upload 4',
+        ])),
+    ]
+    own, total = hot_functions(profiles)
+    assert own == {
+        'gitmesh: serve': 7,
+        'gitmesh: main': 2,
+        'fileserver: upload': 4,
+    }
+    assert total == {
+        'gitmesh: main': 9,
+        'gitmesh: serve': 7,
+        'fileserver: main': 4,
+        'fileserver: upload': 4,
+    }
+
+
+@pytest.mark.parametrize('line', ['', 'no count', 'main;serve 1.5'])
+def test_load_stacks_skips_malformed_lines(tmpdir, line):
+    path = write_stacks(tmpdir, 'gitmesh.txt', [line])
+    assert list(load_stacks(path)) == []